@@ -0,0 +1,518 @@
+# harness.py -- Serial transcript record/replay harness for host.py <-> firmware
+#
+# Transcripts are JSON lines, one per serial line:
+#   {"t": 0.512, "dir": "tx", "data": "{\"type\": \"macro\", ...}"}
+# "tx" is host -> macropad, "rx" is macropad -> host, "t" is seconds since start.
+#
+# Usage:
+#   python harness.py record session.jsonl --port COM3   (runs host.py, logs the session)
+#   python harness.py record session.jsonl --standin     (same, against the pty stand-in)
+#   python harness.py generate big.jsonl --macro-layers 50 --text-length 2000
+#   python harness.py replay session.jsonl --target firmware --speed 0
+#   python harness.py replay session.jsonl --target firmware --port COM3
+#   python harness.py replay session.jsonl --target host --speed 1
+import argparse
+import ast
+import contextlib
+import io
+import json
+import os
+import random
+import select
+import statistics
+import string
+import sys
+import tempfile
+import threading
+import time
+
+import serial
+
+import host
+
+# -----------------------
+# Configuration
+# -----------------------
+FIRMWARE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")
+RESPONSE_TIMEOUT = 2.0
+
+# Lines the firmware prints once it is done with a packet
+OK_TOKENS = ("CONFIG_APPLIED",)
+ERROR_TOKENS = ("BAD_JSON", "BAD_PACKET_TYPE", "SAVE_CONFIG_ERR", "SERIAL_READ_ERR")
+
+# Names pulled out of main.py to run the packet path off-device
+FIRMWARE_NAMES = ("DEFAULT_CONFIG", "save_config", "load_config",
+                  "apply_server_packet", "try_read_serial_json")
+
+# -----------------------
+# Transcript IO
+# -----------------------
+def load_transcript(path):
+    entries = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                entries.append(json.loads(line))
+    return entries
+
+def save_transcript(path, entries):
+    with open(path, "w", encoding="utf-8") as f:
+        for entry in entries:
+            f.write(json.dumps(entry) + "\n")
+
+class TranscriptWriter:
+    def __init__(self, path):
+        self.f = open(path, "w", encoding="utf-8")
+        self.start = time.monotonic()
+        self.lock = threading.Lock()
+
+    def log(self, direction, data):
+        entry = {"t": round(time.monotonic() - self.start, 6), "dir": direction, "data": data}
+        with self.lock:
+            self.f.write(json.dumps(entry) + "\n")
+            self.f.flush()
+
+    def close(self):
+        self.f.close()
+
+# -----------------------
+# Recording
+# -----------------------
+class RecordingSerial:
+    # Wraps a serial.Serial and logs every full line written or read.
+    def __init__(self, ser, writer):
+        self.ser = ser
+        self.writer = writer
+        self.pending = b""
+
+    def write(self, data):
+        self.pending += data
+        while b"\n" in self.pending:
+            line, self.pending = self.pending.split(b"\n", 1)
+            self.writer.log("tx", line.decode("utf-8", "replace"))
+        return self.ser.write(data)
+
+    def readline(self):
+        data = self.ser.readline()
+        if data:
+            self.writer.log("rx", data.decode("utf-8", "replace").rstrip("\r\n"))
+        return data
+
+    def close(self):
+        self.ser.close()
+        self.writer.close()
+
+    def __getattr__(self, name):
+        return getattr(self.ser, name)
+
+def record(path, port=None):
+    # Run the normal host.py menu with its serial port wrapped by a recorder.
+    if port:
+        host.SERIAL_PORT = port
+    writer = TranscriptWriter(path)
+    open_serial = host.open_serial
+    host.open_serial = lambda: RecordingSerial(open_serial(), writer)
+    try:
+        host.main()
+    finally:
+        host.open_serial = open_serial
+    print(f"Transcript saved to {path}")
+
+# -----------------------
+# Synthetic profiles
+# -----------------------
+def random_text(rng, length):
+    alphabet = string.ascii_letters + string.digits + " .,:;()[]{}\"'\\"
+    return "".join(rng.choice(alphabet) for _ in range(length))
+
+def random_action(rng, text_length):
+    kind = rng.choice(("send", "press", "write"))
+    if kind == "send":
+        return {"action": "send", "keys": rng.sample(host.KEYCODES, rng.randint(1, 4))}
+    elif kind == "press":
+        return {"action": "press", "key": rng.choice(host.KEYCODES)}
+    return {"action": "write", "text": random_text(rng, text_length)}
+
+def generate_profile(macro_layers=10, screen_layers=10, actions=8, text_length=64, seed=0):
+    # Packets in the same shape host.prompt_macro / host.prompt_screen build.
+    rng = random.Random(seed)
+    packets = []
+    for n in range(1, macro_layers + 1):
+        keycodes = {}
+        for btn in range(1, 6):
+            keycodes[str(btn)] = [random_action(rng, text_length) for _ in range(actions)]
+        packets.append({"type": "macro", "name": f"Macro{n}", "number": n, "keycodes": keycodes})
+    for n in range(1, screen_layers + 1):
+        packets.append({"type": "screen", "name": f"Screen{n}", "number": n,
+                        "screen": {"line1": random_text(rng, text_length),
+                                   "line2": random_text(rng, text_length)}})
+    return packets
+
+def generate(path, interval=0.1, **profile):
+    packets = generate_profile(**profile)
+    entries = [{"t": round(i * interval, 6), "dir": "tx", "data": json.dumps(p)}
+               for i, p in enumerate(packets)]
+    save_transcript(path, entries)
+    print(f"Wrote {len(entries)} packets to {path}")
+
+# -----------------------
+# Stats
+# -----------------------
+class ReplayStats:
+    def __init__(self):
+        self.packets = 0
+        self.bytes = 0
+        self.elapsed = 0.0
+        self.parse_times = []
+        self.apply_times = []
+        self.round_trips = []
+        self.rx_times = []
+        self.errors = {}
+
+    def error(self, name):
+        self.errors[name] = self.errors.get(name, 0) + 1
+
+    def report(self):
+        elapsed = self.elapsed or 1e-9
+        print("\n--- Replay Report ---")
+        print(f"Packets:     {self.packets}")
+        print(f"Bytes:       {self.bytes}")
+        print(f"Elapsed:     {self.elapsed:.3f}s")
+        print(f"Packets/sec: {self.packets / elapsed:.1f}")
+        print(f"Bytes/sec:   {self.bytes / elapsed:.1f}")
+        print_times("Parse", self.parse_times)
+        print_times("Apply", self.apply_times)
+        print_times("Round trip", self.round_trips)
+        print_times("Receive", self.rx_times, per="rx line")
+        if self.errors:
+            print("Errors:")
+            for name, count in sorted(self.errors.items()):
+                print(f"  {name}: {count}")
+        else:
+            print("Errors:      0")
+
+def print_times(label, times, per="packet"):
+    if not times:
+        return
+    ms = sorted(t * 1000 for t in times)
+    p95 = ms[min(len(ms) - 1, int(len(ms) * 0.95))]
+    print(f"{label} ms/{per}: mean {statistics.mean(ms):.3f}  "
+          f"p50 {statistics.median(ms):.3f}  p95 {p95:.3f}  max {ms[-1]:.3f}")
+
+def wait_until(start, t, speed):
+    # speed 0 means as fast as possible
+    if speed > 0:
+        delay = start + t / speed - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+# -----------------------
+# Firmware stand-in (pty)
+# -----------------------
+class _Runtime:
+    def __init__(self, stdin):
+        self.stdin = stdin
+
+    @property
+    def serial_bytes_available(self):
+        return self.stdin.available()
+
+class _Supervisor:
+    def __init__(self, stdin):
+        self.runtime = _Runtime(stdin)
+
+class _PtyStdin:
+    # Line reader over the pty master, standing in for the USB CDC sys.stdin.
+    def __init__(self, fd):
+        self.fd = fd
+        self.buf = b""
+
+    def available(self):
+        if self.buf:
+            return True
+        ready, _, _ = select.select([self.fd], [], [], 0)
+        return bool(ready)
+
+    def fill_line(self):
+        while b"\n" not in self.buf:
+            chunk = os.read(self.fd, 65536)
+            if not chunk:
+                break
+            self.buf += chunk
+
+    def readline(self):
+        self.fill_line()
+        line, sep, self.buf = self.buf.partition(b"\n")
+        return (line + sep).decode("utf-8", "replace")
+
+class _Sys:
+    def __init__(self, stdin):
+        self.stdin = stdin
+
+class FirmwareStandIn:
+    # Runs the packet functions from main.py against one end of a pty,
+    # with config.json redirected to a temp dir. The other end of the pty
+    # behaves like the macropad's serial port.
+    def __init__(self, firmware_path=FIRMWARE_PATH):
+        self.master, slave = os.openpty()
+        self.port = os.ttyname(slave)
+        self.slave = slave
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.parse_times = []
+        self.apply_times = []
+        self.running = False
+        self.thread = None
+        self.ns = self.load_firmware(firmware_path)
+
+    def load_firmware(self, firmware_path):
+        with open(firmware_path, "r", encoding="utf-8") as f:
+            tree = ast.parse(f.read(), firmware_path)
+        body = []
+        for node in tree.body:
+            if isinstance(node, ast.FunctionDef) and node.name in FIRMWARE_NAMES:
+                body.append(node)
+            elif isinstance(node, ast.Assign) and any(
+                    isinstance(t, ast.Name) and t.id in FIRMWARE_NAMES for t in node.targets):
+                body.append(node)
+        module = ast.Module(body=body, type_ignores=[])
+
+        stdin = _PtyStdin(self.master)
+        ns = {
+            "json": json,
+            "time": time,
+            "sys": _Sys(stdin),
+            "supervisor": _Supervisor(stdin),
+            "print": self.device_print,
+        }
+        exec(compile(module, firmware_path, "exec"), ns)
+        ns["CONFIG_PATH"] = os.path.join(self.tmpdir.name, "config.json")
+
+        # Split timing: parse is everything in try_read_serial_json except apply
+        apply_server_packet = ns["apply_server_packet"]
+        def timed_apply(packet):
+            t0 = time.perf_counter()
+            try:
+                return apply_server_packet(packet)
+            finally:
+                self.apply_times.append(time.perf_counter() - t0)
+        ns["apply_server_packet"] = timed_apply
+        ns["load_config"]()
+        return ns
+
+    def device_print(self, *args, **kwargs):
+        line = " ".join(str(a) for a in args) + kwargs.get("end", "\n")
+        os.write(self.master, line.encode("utf-8"))
+
+    def serve(self):
+        try_read_serial_json = self.ns["try_read_serial_json"]
+        stdin = self.ns["sys"].stdin
+        while self.running:
+            if not stdin.available():
+                time.sleep(0.001)
+                continue
+            # Pull the whole line off the pty first so parse time
+            # doesn't include waiting on the transfer.
+            stdin.fill_line()
+            applied = len(self.apply_times)
+            t0 = time.perf_counter()
+            try_read_serial_json()
+            total = time.perf_counter() - t0
+            if len(self.apply_times) > applied:
+                total -= self.apply_times[-1]
+            self.parse_times.append(total)
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.serve, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread:
+            self.thread.join()
+        os.close(self.master)
+        os.close(self.slave)
+        self.tmpdir.cleanup()
+
+# -----------------------
+# Replay
+# -----------------------
+def wait_for_token(ser, timeout):
+    # Read firmware lines until it reports how the packet went, or None.
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        line = ser.readline().decode("utf-8", "replace").strip()
+        if not line:
+            continue
+        token = line.split()[0]
+        if token in OK_TOKENS or token in ERROR_TOKENS:
+            return token
+    return None
+
+def read_response(ser, stats):
+    token = wait_for_token(ser, RESPONSE_TIMEOUT)
+    if token is None:
+        stats.error("TIMEOUT")
+        # The firmware handles one packet at a time, so give the late reply
+        # another timeout to show up and throw it away, rather than charging
+        # it to the next packet.
+        wait_for_token(ser, RESPONSE_TIMEOUT)
+        ser.reset_input_buffer()
+        return False
+    if token in ERROR_TOKENS:
+        stats.error(token)
+        return False
+    return True
+
+def require_pty():
+    if not hasattr(os, "openpty"):
+        sys.exit("The pty firmware stand-in needs Linux/macOS; pass --port to use a real board.")
+
+def replay_firmware(entries, speed=0, port=None):
+    # Send recorded host packets to the firmware (stand-in or a real port)
+    # and wait for each one to be acknowledged.
+    stats = ReplayStats()
+    standin = None
+    ser = None
+    if port is None:
+        require_pty()
+        standin = FirmwareStandIn()
+        standin.start()
+        port = standin.port
+    try:
+        ser = serial.Serial(port, host.BAUD_RATE, timeout=0.1)
+        start = time.monotonic()
+        for entry in entries:
+            # The firmware ignores blank lines without replying
+            if entry.get("dir") != "tx" or not entry["data"].strip():
+                continue
+            wait_until(start, entry.get("t", 0), speed)
+            data = (entry["data"] + "\n").encode("utf-8")
+            t0 = time.perf_counter()
+            ser.write(data)
+            read_response(ser, stats)
+            stats.round_trips.append(time.perf_counter() - t0)
+            stats.packets += 1
+            stats.bytes += len(data)
+        stats.elapsed = time.monotonic() - start
+    finally:
+        if ser:
+            ser.close()
+        if standin:
+            standin.stop()
+            stats.parse_times = standin.parse_times
+            stats.apply_times = standin.apply_times
+    return stats
+
+class ReplaySerial:
+    # Serial stand-in for host.py: swallows writes, serves queued rx lines.
+    def __init__(self):
+        self.rx = []
+        self.written = 0
+
+    @property
+    def in_waiting(self):
+        return sum(len(line) for line in self.rx)
+
+    def readline(self):
+        return self.rx.pop(0) if self.rx else b""
+
+    def write(self, data):
+        self.written += len(data)
+        return len(data)
+
+    def close(self):
+        pass
+
+def replay_host(entries, speed=0):
+    # Drive host.send_packet / host.receive_response from a transcript.
+    # Only tx entries count as packets; apply is host.send_packet and
+    # receive is host.receive_response on each recorded rx line.
+    stats = ReplayStats()
+    ser = ReplaySerial()
+    start = time.monotonic()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for entry in entries:
+            wait_until(start, entry.get("t", 0), speed)
+            data = (entry["data"] + "\n").encode("utf-8")
+            if entry.get("dir") == "tx":
+                if not entry["data"].strip():
+                    continue
+                stats.packets += 1
+                stats.bytes += len(data)
+                try:
+                    packet = json.loads(entry["data"])
+                except ValueError:
+                    stats.error("BAD_JSON")
+                    continue
+                written = ser.written
+                t0 = time.perf_counter()
+                host.send_packet(ser, packet)
+                stats.apply_times.append(time.perf_counter() - t0)
+                if ser.written == written:
+                    stats.error("SEND_FAILED")
+            else:
+                ser.rx.append(data)
+                t0 = time.perf_counter()
+                host.receive_response(ser)
+                stats.rx_times.append(time.perf_counter() - t0)
+                token = entry["data"].split()[0] if entry["data"].strip() else ""
+                if token in ERROR_TOKENS:
+                    stats.error(token)
+    stats.elapsed = time.monotonic() - start
+    return stats
+
+# -----------------------
+# Main
+# -----------------------
+def main():
+    parser = argparse.ArgumentParser(description="Record and replay macropad serial sessions.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    rec = sub.add_parser("record", help="run host.py and record the session")
+    rec.add_argument("transcript")
+    rec.add_argument("--port", help="serial port (default: host.SERIAL_PORT)")
+    rec.add_argument("--standin", action="store_true", help="record against the pty firmware stand-in")
+
+    rep = sub.add_parser("replay", help="replay a transcript and report throughput")
+    rep.add_argument("transcript")
+    rep.add_argument("--target", choices=("firmware", "host"), default="firmware")
+    rep.add_argument("--port", help="real serial port (default: pty firmware stand-in)")
+    rep.add_argument("--speed", type=float, default=1.0, help="1 = real time, 0 = as fast as possible")
+
+    gen = sub.add_parser("generate", help="write a synthetic large-profile transcript")
+    gen.add_argument("transcript")
+    gen.add_argument("--macro-layers", type=int, default=10)
+    gen.add_argument("--screen-layers", type=int, default=10)
+    gen.add_argument("--actions", type=int, default=8, help="actions per button")
+    gen.add_argument("--text-length", type=int, default=64)
+    gen.add_argument("--interval", type=float, default=0.1, help="seconds between packets")
+    gen.add_argument("--seed", type=int, default=0)
+
+    args = parser.parse_args()
+    if args.command == "record":
+        if args.standin:
+            require_pty()
+            standin = FirmwareStandIn()
+            standin.start()
+            try:
+                record(args.transcript, port=standin.port)
+            finally:
+                standin.stop()
+        else:
+            record(args.transcript, port=args.port)
+    elif args.command == "generate":
+        generate(args.transcript, interval=args.interval, macro_layers=args.macro_layers,
+                 screen_layers=args.screen_layers, actions=args.actions,
+                 text_length=args.text_length, seed=args.seed)
+    else:
+        entries = load_transcript(args.transcript)
+        if args.target == "firmware":
+            stats = replay_firmware(entries, speed=args.speed, port=args.port)
+        else:
+            stats = replay_host(entries, speed=args.speed)
+        stats.report()
+
+if __name__ == "__main__":
+    main()